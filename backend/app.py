@@ -1,18 +1,30 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from ultralytics import YOLO
+from ultralytics.nn.autobackend import AutoBackend
+import torch
+import torch.nn.functional as F
+from torchvision.ops import batched_nms
 import cv2
 import numpy as np
-from PIL import Image
 import io
-from typing import List, Dict
+from typing import List, Dict, Tuple
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+try:
+    from ultralytics.utils.nms import non_max_suppression
+except ImportError:  # older ultralytics releases keep NMS in ops
+    from ultralytics.utils.ops import non_max_suppression
 
 app = FastAPI(
     title="PPE Detection API",
     description="API for detecting Personal Protective Equipment (Person, Helmet, Safety-vest)",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -29,15 +41,370 @@ app.add_middleware(
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "..", "mlsrc", "weights", "best.pt")
 model = None
+inference_backend = None
+class_names = ()
+
+# Dtype of the backend's input binding (FP16 engines / half weights, FP32 otherwise, e.g. INT8 engines)
+input_dtype = torch.float32
+
+# Inference settings: FP16 on the GPU when available, fixed input size
+DEVICE = 0 if torch.cuda.is_available() else "cpu"
+HALF = torch.cuda.is_available()
+IMGSZ = 640
+IOU_THRESHOLD = 0.7
+MAX_DET = 300
+
+# TensorRT export settings (shared with app_enhanced.py)
+PPE_INT8 = os.getenv("PPE_INT8", "false").lower() == "true"
+PPE_CALIB_DATA = os.getenv("PPE_CALIB_DATA", "calib.yaml")
+
+# INT8 TorchScript model produced by quantize_int8.py, used instead of the FP32 weights on CPU-only hosts
+INT8_MODEL_PATH = os.path.splitext(MODEL_PATH)[0] + "_int8.pt"
+
+# Micro-batching: concurrent requests are coalesced into one model.predict call
+MAX_BATCH = 16
+MAX_WAIT_MS = 10
+inference_queue = None
+batch_task = None
+
+# With tile=true, uploads larger than TILE_THRESHOLD are split into overlapping tiles that, together with the
+# full frame, fit in a single batch; tile detections are merged with class-aware NMS
+TILE_THRESHOLD = 2 * IMGSZ
+TILE_OVERLAP = 0.2
+MAX_TILES = MAX_BATCH - 1
+TILE_NMS_IOU = 0.5
+
+# TensorRT engine exported next to the .pt weights on CUDA hosts; the name records the batch
+# profile and precision so it is never mixed up with app_enhanced.py's engine in the shared folder
+ENGINE_PATH = f"{os.path.splitext(MODEL_PATH)[0]}_b{MAX_BATCH}_{'int8' if PPE_INT8 else 'fp16'}.engine"
+
+# With the compiled forward, batches are zero-padded to the next of these sizes so CUDA graphs are
+# only captured for a fixed set of shapes, all of them during startup warmup
+BATCH_BUCKETS = (1, 4, 8, 16)
+pad_batches = False
+
+# Batches run on a single dedicated thread so compiled CUDA graphs are always replayed from it
+inference_executor = ThreadPoolExecutor(max_workers=1)
+
+def load_inference_model():
+    """Load a TensorRT engine on CUDA hosts, falling back to the .pt weights on CPU"""
+    if not torch.cuda.is_available():
+        return YOLO(MODEL_PATH)
+    
+    if not os.path.exists(ENGINE_PATH):
+        export_args = {
+            "format": "engine",
+            "half": True,
+            "imgsz": IMGSZ,
+            "workspace": 4,
+            "dynamic": True,
+            "batch": MAX_BATCH
+        }
+        if PPE_INT8:
+            # INT8 post-training quantization calibrates on the images listed in PPE_CALIB_DATA
+            export_args.update(int8=True, data=PPE_CALIB_DATA)
+        try:
+            exported = YOLO(MODEL_PATH).export(**export_args)
+        except Exception as e:
+            print(f"TensorRT export failed, using PyTorch weights: {e}")
+            return YOLO(MODEL_PATH)
+        os.replace(exported, ENGINE_PATH)
+    
+    print(f"Using TensorRT engine {ENGINE_PATH}")
+    return YOLO(ENGINE_PATH)
 
 @app.on_event("startup")
 async def load_model():
     """Load the YOLO model on startup"""
-    global model
+    global model, inference_backend, class_names, inference_queue, batch_task, pad_batches, input_dtype
     if not os.path.exists(MODEL_PATH):
         raise FileNotFoundError(f"Model not found at {MODEL_PATH}")
-    model = YOLO(MODEL_PATH)
+    model = load_inference_model()
     print(f"Model loaded successfully from {MODEL_PATH}")
+    
+    # Class names indexed by class id, resolved once instead of via the names dict per box
+    class_names = tuple(model.names[class_id] for class_id in range(len(model.names)))
+    
+    # Move PyTorch weights to the GPU in NHWC layout and fuse Conv+BN layers
+    if isinstance(model.model, torch.nn.Module):
+        if torch.cuda.is_available():
+            model.to("cuda")
+            model.model = model.model.to(memory_format=torch.channels_last)
+        model.fuse()
+    
+    # Input shape is fixed at IMGSZ, so let cuDNN benchmark and cache the fastest kernels
+    if torch.cuda.is_available():
+        torch.backends.cudnn.benchmark = True
+    
+    # Compile the forward pass in place; Ultralytics re-fuses the module when it builds its
+    # predictor, which would discard a wrapping torch.compile module
+    if hasattr(torch, "compile") and torch.cuda.is_available() and isinstance(model.model, torch.nn.Module):
+        model.model.forward = torch.compile(model.model.forward, mode="reduce-overhead", dynamic=False)
+        pad_batches = True
+    
+    # Call the forward pass directly instead of going through YOLO.predict on every batch
+    if not torch.cuda.is_available() and os.path.exists(INT8_MODEL_PATH):
+        torch.backends.quantized.engine = "x86"
+        inference_backend = torch.jit.load(INT8_MODEL_PATH, map_location="cpu")
+        print(f"Using INT8 model {INT8_MODEL_PATH}")
+    else:
+        inference_backend = AutoBackend(
+            model.model,
+            device=torch.device("cuda:0" if torch.cuda.is_available() else "cpu"),
+            fp16=HALF,
+            fuse=True,
+            verbose=False
+        )
+    
+    # run_batch calls the backend directly, so letterbox must produce what its input binding expects:
+    # AutoBackend only upcasts inputs to half, and INT8 engines are exported with FP32 inputs
+    input_dtype = torch.float16 if getattr(inference_backend, "fp16", False) else torch.float32
+    
+    # Warm up so the first request doesn't pay for kernel selection and allocation; with padded
+    # batches, every bucket size is compiled and its CUDA graph captured here rather than under load
+    warmup_img = np.zeros((IMGSZ, IMGSZ, 3), dtype=np.uint8)
+    for batch_size in (BATCH_BUCKETS if pad_batches else (1,)):
+        for _ in range(3 if pad_batches else 2):
+            await asyncio.get_running_loop().run_in_executor(
+                inference_executor, run_batch, [warmup_img] * batch_size, 0.25
+            )
+    
+    # Start the batching worker
+    inference_queue = asyncio.Queue()
+    batch_task = asyncio.create_task(batch_worker())
+
+def letterbox(img_array: np.ndarray) -> Tuple[torch.Tensor, Tuple[float, int, int]]:
+    """
+    Resize and pad a BGR image into a (1, 3, IMGSZ, IMGSZ) RGB tensor on the inference device
+    
+    On CUDA hosts the raw frame is uploaded once through pinned memory and resized on the GPU;
+    otherwise OpenCV's SIMD resize is used. Returns the tensor and (gain, pad_x, pad_y) for
+    mapping boxes back to the original image.
+    """
+    h, w = img_array.shape[:2]
+    gain = min(IMGSZ / h, IMGSZ / w)
+    new_w, new_h = round(w * gain), round(h * gain)
+    pad_x, pad_y = (IMGSZ - new_w) // 2, (IMGSZ - new_h) // 2
+    pad = (pad_x, IMGSZ - new_w - pad_x, pad_y, IMGSZ - new_h - pad_y)
+    
+    if torch.cuda.is_available():
+        pinned = torch.from_numpy(img_array).pin_memory()
+        tensor = pinned.to("cuda", non_blocking=True).permute(2, 0, 1).unsqueeze(0)
+        tensor = tensor.flip(1).to(input_dtype).div_(255)
+        tensor = F.interpolate(tensor, size=(new_h, new_w), mode="bilinear", align_corners=False)
+        tensor = F.pad(tensor, pad, value=114 / 255)
+    else:
+        resized = cv2.resize(img_array, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        padded = cv2.copyMakeBorder(resized, pad[2], pad[3], pad[0], pad[1], cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        tensor = torch.from_numpy(padded[..., ::-1].transpose(2, 0, 1).copy()).unsqueeze(0).float().div_(255)
+    
+    return tensor, (gain, pad_x, pad_y)
+
+def run_batch(images: List[np.ndarray], conf: float) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Run a single batched prediction without autograd bookkeeping
+    
+    Returns (xyxy, conf, cls) arrays per image, with boxes in original image coordinates.
+    """
+    with torch.inference_mode():
+        letterboxed = [letterbox(img) for img in images]
+        batch = torch.cat([tensor for tensor, _ in letterboxed])
+        if pad_batches:
+            bucket = next(size for size in BATCH_BUCKETS if size >= len(batch))
+            batch = torch.cat([batch, batch.new_zeros((bucket - len(batch), *batch.shape[1:]))])
+        preds = non_max_suppression(inference_backend(batch), conf, IOU_THRESHOLD, max_det=MAX_DET)
+    
+    outputs = []
+    for det, img, (_, (gain, pad_x, pad_y)) in zip(preds, images, letterboxed):
+        h, w = img.shape[:2]
+        det = det.float().cpu().numpy()
+        xyxy = (det[:, :4] - (pad_x, pad_y, pad_x, pad_y)) / gain
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+        outputs.append((
+            xyxy.astype(np.float32),
+            det[:, 4],
+            det[:, 5].astype(np.int32)
+        ))
+    return outputs
+
+async def batch_worker():
+    """Drain the inference queue and run queued images as a single batch"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await inference_queue.get()]
+        deadline = loop.time() + MAX_WAIT_MS / 1000
+        
+        # Collect up to MAX_BATCH items or until MAX_WAIT_MS elapses
+        while len(batch) < MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(inference_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        images = [img for img, _, _ in batch]
+        
+        # Run at the lowest threshold in the batch and re-filter per request
+        min_conf = min(conf for _, conf, _ in batch)
+        
+        try:
+            results = await loop.run_in_executor(inference_executor, run_batch, images, min_conf)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        for (_, conf, future), (xyxy, confs, clss) in zip(batch, results):
+            if not future.done():
+                keep = confs >= conf
+                future.set_result((xyxy[keep], confs[keep], clss[keep]))
+
+# libjpeg-turbo's SIMD encoder when PyTurboJPEG and the shared library are installed
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    turbo_jpeg = None
+
+# Image decoding runs on its own pool so it overlaps with inference
+decode_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+def read_upload(file: UploadFile) -> np.ndarray:
+    """Read an upload's spooled file into a uint8 buffer without an intermediate bytes copy"""
+    spooled = file.file
+    spooled.seek(0)
+    if file.size is None:
+        return np.frombuffer(spooled.read(), np.uint8)
+    
+    buffer = np.empty(file.size, dtype=np.uint8)
+    n = spooled.readinto(buffer)
+    return buffer[:n]
+
+def decode_image(file: UploadFile) -> np.ndarray:
+    """Read an upload and decode it straight into a BGR array"""
+    img_array = cv2.imdecode(read_upload(file), cv2.IMREAD_COLOR)
+    if img_array is None:
+        raise ValueError("Could not decode image")
+    return img_array
+
+@lru_cache(maxsize=512)
+def get_label_size(label: str):
+    """Cached cv2.getTextSize for box labels (class name + 2-decimal confidence)"""
+    return cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+
+# Define colors for each class, indexed by class id (BGR format)
+CLASS_COLORS = (
+    (0, 255, 0),    # 0: person - Green
+    (255, 0, 0),    # 1: helmet - Blue
+    (0, 165, 255)   # 2: safety-vest - Orange
+)
+
+def draw_detections(img: np.ndarray, xyxy: np.ndarray, confs: np.ndarray, clss: np.ndarray):
+    """Draw bounding boxes and labels onto a BGR image in place"""
+    # Box outlines: one polylines call per class instead of one rectangle call per box
+    corners = xyxy[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+    for class_id in np.unique(clss).tolist():
+        cv2.polylines(img, list(corners[clss == class_id]), True, CLASS_COLORS[class_id], 2)
+    
+    # Labels are drawn on top of all outlines
+    for (x1, y1, _, _), confidence, class_id in zip(xyxy.tolist(), confs.tolist(), clss.tolist()):
+        class_name = class_names[class_id]
+        color = CLASS_COLORS[class_id]
+        label = f"{class_name}: {confidence:.2f}"
+        (label_width, label_height), baseline = get_label_size(label)
+        
+        # Background rectangle for the label, then the text
+        cv2.rectangle(
+            img,
+            (x1, y1 - label_height - baseline - 5),
+            (x1 + label_width, y1),
+            color,
+            -1
+        )
+        cv2.putText(
+            img,
+            label,
+            (x1, y1 - baseline - 5),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.6,
+            (255, 255, 255),
+            2
+        )
+
+def encode_jpeg(img: np.ndarray) -> bytes:
+    """Encode a BGR image to JPEG at quality 95"""
+    if turbo_jpeg is not None:
+        return turbo_jpeg.encode(img, quality=95, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    if not ok:
+        raise ValueError("Could not encode annotated image")
+    return encoded.tobytes()
+
+def tile_starts(length: int, size: int, stride: int) -> List[int]:
+    """Start offsets of tiles along one axis, with the last tile aligned to the edge"""
+    if length <= size:
+        return [0]
+    return list(range(0, length - size, stride)) + [length - size]
+
+def make_tiles(img_array: np.ndarray) -> List[Tuple[int, int, np.ndarray]]:
+    """
+    Split an image into overlapping square crops as (x0, y0, crop) views
+    
+    Tiles start at IMGSZ and grow until the grid fits in MAX_TILES, so inference cost stays
+    bounded however large the upload is.
+    """
+    h, w = img_array.shape[:2]
+    size = IMGSZ
+    while True:
+        stride = int(size * (1 - TILE_OVERLAP))
+        xs = tile_starts(w, size, stride)
+        ys = tile_starts(h, size, stride)
+        if len(xs) * len(ys) <= MAX_TILES:
+            break
+        size += IMGSZ // 2
+    
+    return [(x0, y0, img_array[y0:y0 + size, x0:x0 + size]) for y0 in ys for x0 in xs]
+
+async def detect(
+    img_array: np.ndarray,
+    conf_threshold: float,
+    tile: bool = False
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Run detection on an image, optionally tiling it when it is much larger than IMGSZ"""
+    h, w = img_array.shape[:2]
+    if not tile or max(h, w) <= TILE_THRESHOLD:
+        return await enqueue(img_array, conf_threshold)
+    
+    # The full frame keeps large objects that span several tiles intact
+    tiles = [(0, 0, img_array)] + make_tiles(img_array)
+    outputs = await asyncio.gather(*(enqueue(crop, conf_threshold) for _, _, crop in tiles))
+    
+    # Shift tile boxes into image coordinates and merge duplicates across tiles
+    xyxy = np.concatenate([
+        boxes + np.array([x0, y0, x0, y0], dtype=np.float32)
+        for (x0, y0, _), (boxes, _, _) in zip(tiles, outputs)
+    ])
+    confs = np.concatenate([tile_confs for _, tile_confs, _ in outputs])
+    clss = np.concatenate([tile_clss for _, _, tile_clss in outputs])
+    
+    keep = batched_nms(
+        torch.from_numpy(xyxy),
+        torch.from_numpy(confs),
+        torch.from_numpy(clss),
+        TILE_NMS_IOU
+    ).numpy()
+    return xyxy[keep], confs[keep], clss[keep]
+
+async def enqueue(img_array: np.ndarray, conf_threshold: float):
+    """Submit an image to the batching worker and wait for its result"""
+    future = asyncio.get_running_loop().create_future()
+    await inference_queue.put((img_array, conf_threshold, future))
+    return await future
 
 @app.get("/")
 async def root():
@@ -79,7 +446,8 @@ async def model_info():
 @app.post("/predict")
 async def predict(
     file: UploadFile = File(...),
-    conf_threshold: float = 0.25
+    conf_threshold: float = 0.25,
+    tile: bool = False
 ):
     """
     Detect PPE in uploaded image
@@ -87,6 +455,7 @@ async def predict(
     Parameters:
     - file: Image file (jpg, jpeg, png)
     - conf_threshold: Confidence threshold for detections (default: 0.25)
+    - tile: Split images larger than 1280px into overlapping 640px-scale tiles (default: false)
     
     Returns:
     - detections: List of detected objects with bounding boxes and confidence scores
@@ -100,50 +469,33 @@ async def predict(
         raise HTTPException(status_code=400, detail="File must be an image")
     
     try:
-        # Read image file
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        # Convert PIL Image to numpy array
-        img_array = np.array(image)
+        # Read and decode the image file off the event loop
+        img_array = await asyncio.get_running_loop().run_in_executor(
+            decode_executor, decode_image, file
+        )
         
-        # Convert RGB to BGR for OpenCV (if needed)
-        if len(img_array.shape) == 3 and img_array.shape[2] == 3:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        
-        # Run inference
-        results = model.predict(source=img_array, conf=conf_threshold, verbose=False)
+        # Run inference through the batching queue
+        xyxy, confs, clss = await detect(img_array, conf_threshold, tile)
         
         # Parse results
-        detections = []
-        class_counts = {"person": 0, "helmet": 0, "safety-vest": 0}
+        xyxy_r = np.round(xyxy.astype(np.float64), 2).tolist()
+        confs_r = np.round(confs.astype(np.float64), 3).tolist()
+        
+        detections = [
+            {
+                "class_id": class_id,
+                "class_name": class_names[class_id],
+                "confidence": confidence,
+                "bounding_box": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+            }
+            for (x1, y1, x2, y2), confidence, class_id in zip(xyxy_r, confs_r, clss.tolist())
+        ]
         
-        for result in results:
-            if result.boxes is not None and len(result.boxes) > 0:
-                for box, conf, cls in zip(result.boxes.xyxy, result.boxes.conf, result.boxes.cls):
-                    x1, y1, x2, y2 = map(float, box)
-                    confidence = float(conf)
-                    class_id = int(cls)
-                    class_name = model.names[class_id]
-                    
-                    detection = {
-                        "class_id": class_id,
-                        "class_name": class_name,
-                        "confidence": round(confidence, 3),
-                        "bounding_box": {
-                            "x1": round(x1, 2),
-                            "y1": round(y1, 2),
-                            "x2": round(x2, 2),
-                            "y2": round(y2, 2)
-                        }
-                    }
-                    detections.append(detection)
-                    
-                    # Update class counts
-                    if class_name in class_counts:
-                        class_counts[class_name] += 1
+        # Count detections per class
+        counts = np.bincount(clss, minlength=len(class_names)).tolist()
+        class_counts = dict(zip(class_names, counts))
         
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "success": True,
             "image_name": file.filename,
             "detections_count": len(detections),
@@ -160,7 +512,8 @@ async def predict(
 @app.post("/predict-image")
 async def predict_image(
     file: UploadFile = File(...),
-    conf_threshold: float = 0.25
+    conf_threshold: float = 0.25,
+    tile: bool = False
 ):
     """
     Detect PPE in uploaded image and return annotated image
@@ -168,6 +521,7 @@ async def predict_image(
     Parameters:
     - file: Image file (jpg, jpeg, png)
     - conf_threshold: Confidence threshold for detections (default: 0.25)
+    - tile: Split images larger than 1280px into overlapping 640px-scale tiles (default: false)
     
     Returns:
     - Annotated image with bounding boxes and labels
@@ -180,84 +534,22 @@ async def predict_image(
         raise HTTPException(status_code=400, detail="File must be an image")
     
     try:
-        # Read image file
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        # Convert PIL Image to numpy array
-        img_array = np.array(image)
-        
-        # Convert RGB to BGR for OpenCV
-        if len(img_array.shape) == 3 and img_array.shape[2] == 3:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        
-        # Run inference
-        results = model.predict(source=img_array, conf=conf_threshold, verbose=False)
-        
-        # Draw bounding boxes on the image
-        annotated_img = img_array.copy()
-        
-        # Define colors for each class (BGR format)
-        colors = {
-            "person": (0, 255, 0),      # Green
-            "helmet": (255, 0, 0),       # Blue
-            "safety-vest": (0, 165, 255) # Orange
-        }
-        
-        for result in results:
-            if result.boxes is not None and len(result.boxes) > 0:
-                for box, conf, cls in zip(result.boxes.xyxy, result.boxes.conf, result.boxes.cls):
-                    x1, y1, x2, y2 = map(int, box)
-                    confidence = float(conf)
-                    class_id = int(cls)
-                    class_name = model.names[class_id]
-                    
-                    # Get color for this class
-                    color = colors.get(class_name, (255, 255, 255))
-                    
-                    # Draw bounding box
-                    cv2.rectangle(annotated_img, (x1, y1), (x2, y2), color, 2)
-                    
-                    # Create label with class name and confidence
-                    label = f"{class_name}: {confidence:.2f}"
-                    
-                    # Get label size for background rectangle
-                    (label_width, label_height), baseline = cv2.getTextSize(
-                        label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2
-                    )
-                    
-                    # Draw background rectangle for label
-                    cv2.rectangle(
-                        annotated_img,
-                        (x1, y1 - label_height - baseline - 5),
-                        (x1 + label_width, y1),
-                        color,
-                        -1
-                    )
-                    
-                    # Draw label text
-                    cv2.putText(
-                        annotated_img,
-                        label,
-                        (x1, y1 - baseline - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.6,
-                        (255, 255, 255),
-                        2
-                    )
+        # Read and decode the image file off the event loop
+        img_array = await asyncio.get_running_loop().run_in_executor(
+            decode_executor, decode_image, file
+        )
         
-        # Convert back to RGB for PIL
-        annotated_img = cv2.cvtColor(annotated_img, cv2.COLOR_BGR2RGB)
+        # Run inference through the batching queue
+        xyxy, confs, clss = await detect(img_array, conf_threshold, tile)
         
-        # Convert to PIL Image
-        pil_img = Image.fromarray(annotated_img)
+        # Draw bounding boxes in place; the decoded buffer is owned by this request
+        annotated_img = img_array
+        draw_detections(annotated_img, xyxy.astype(np.int32), confs, clss)
         
-        # Save to bytes buffer
-        img_buffer = io.BytesIO()
-        pil_img.save(img_buffer, format="JPEG", quality=95)
-        img_buffer.seek(0)
+        # Encode the BGR image directly to JPEG
+        jpeg_bytes = encode_jpeg(annotated_img)
         
-        return StreamingResponse(img_buffer, media_type="image/jpeg")
+        return StreamingResponse(io.BytesIO(jpeg_bytes), media_type="image/jpeg")
         
     except Exception as e:
         import traceback
@@ -265,5 +557,14 @@ async def predict_image(
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop has no Windows support
+        http="httptools",
+        limit_concurrency=512,
+        timeout_keep_alive=30
+    )
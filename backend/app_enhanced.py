@@ -1,16 +1,25 @@
 """Enhanced PPE Detection API with advanced features"""
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from ultralytics import YOLO
+import torch
 import cv2
+import av
+from av.codec.hwaccel import HWAccel, hwdevices_available
 import numpy as np
-from PIL import Image
+from typing import List, Dict, Optional, Tuple, BinaryIO
 import io
-from typing import List, Dict, Optional
 import os
+import mmap
 import time
+import asyncio
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, closing
+from functools import lru_cache
 from datetime import datetime
 
 # Import database and models
@@ -21,9 +30,11 @@ from models import (
     DetectionSummary, ComplianceStatus, VideoFrameDetection
 )
 from utils import (
-    generate_request_id, save_detection_record, save_video_processing_record,
+    generate_request_id, generate_child_id, save_detection_record, save_detection_records_bulk,
+    detection_record_row, save_video_processing_record,
     get_analytics, get_recent_detections, check_compliance
 )
+from detection_utils import parse_boxes, counts_from_cls, to_detection_dicts
 from sqlalchemy.orm import Session
 
 app = FastAPI(
@@ -36,7 +47,8 @@ app = FastAPI(
     },
     license_info={
         "name": "MIT"
-    }
+    },
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -53,6 +65,90 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, "..", "mlsrc", "weights", "best.pt")
 model = None
 
+# Inference backend: "trt" (TensorRT engine), "onnx" (ONNX Runtime) or "pt" (PyTorch weights).
+# Exported models are written next to the .pt weights on first startup and reused afterwards.
+PPE_BACKEND = os.getenv("PPE_BACKEND", "trt" if torch.cuda.is_available() else "pt").lower()
+PPE_INT8 = os.getenv("PPE_INT8", "false").lower() == "true"
+PPE_CALIB_DATA = os.getenv("PPE_CALIB_DATA", "calib.yaml")
+EXPORT_FORMATS = {
+    "trt": ("engine", ".engine"),
+    "onnx": ("onnx", ".onnx")
+}
+
+# Fixed model.predict arguments: input size, device and FP16 on CUDA hosts
+PREDICT_KW = {
+    "imgsz": 640,
+    "device": 0 if torch.cuda.is_available() else "cpu",
+    "half": torch.cuda.is_available(),
+    "verbose": False
+}
+
+# Largest number of images accepted by /predict-batch (and the exported models' batch size)
+MAX_BATCH_IMAGES = 50
+
+# Class names in class id order, used for per-class counts
+CLASS_NAMES = ("person", "helmet", "safety-vest")
+
+# Annotation colors indexed by class id (BGR format)
+CLASS_COLORS = (
+    (0, 255, 0),    # 0: person - Green
+    (255, 0, 0),    # 1: helmet - Blue
+    (0, 165, 255)   # 2: safety-vest - Orange
+)
+
+# Number of per-frame results returned by /predict-video (limits response size)
+MAX_RESPONSE_FRAMES = 50
+
+# Every model.predict call runs on this one thread, since the Ultralytics predictor is not thread-safe
+inference_executor = ThreadPoolExecutor(max_workers=1)
+
+# Sampled video frames are run through the model this many at a time, with up to
+# FRAME_QUEUE_SIZE decoded frames buffered ahead by the decoding thread
+VIDEO_BATCH_SIZE = 16
+FRAME_QUEUE_SIZE = VIDEO_BATCH_SIZE
+
+# Decode videos with NVDEC on CUDA hosts whose FFmpeg build supports it; streams the
+# hardware decoder cannot handle fall back to software decoding
+VIDEO_HWACCEL = (
+    HWAccel(device_type="cuda", allow_software_fallback=True)
+    if torch.cuda.is_available() and "cuda" in hwdevices_available() else None
+)
+
+def load_inference_model() -> YOLO:
+    """Load the model for PPE_BACKEND, exporting it from the .pt weights if needed"""
+    if PPE_BACKEND not in EXPORT_FORMATS:
+        return YOLO(MODEL_PATH)
+    
+    export_format, suffix = EXPORT_FORMATS[PPE_BACKEND]
+    # The name records the batch profile and precision, so exports made with other settings
+    # (or app.py's engine in the same folder) are never picked up by mistake
+    precision = ("int8" if PPE_INT8 else "fp16") if PPE_BACKEND == "trt" else "fp32"
+    export_path = f"{os.path.splitext(MODEL_PATH)[0]}_b{MAX_BATCH_IMAGES}_{precision}{suffix}"
+    if not os.path.exists(export_path):
+        export_args = {
+            "format": export_format,
+            "imgsz": 640,
+            "dynamic": True,
+            "batch": MAX_BATCH_IMAGES
+        }
+        if PPE_BACKEND == "trt":
+            export_args.update(half=True, workspace=4)
+            if PPE_INT8:
+                # INT8 post-training quantization calibrates on the images listed in PPE_CALIB_DATA
+                export_args.update(int8=True, data=PPE_CALIB_DATA)
+        try:
+            exported = YOLO(MODEL_PATH).export(**export_args)
+        except Exception as e:
+            print(f"⚠️ {export_format} export failed, using PyTorch weights: {e}")
+            return YOLO(MODEL_PATH)
+        
+        # Exporters name the file after the weights; move it to the settings-specific name
+        os.replace(exported, export_path)
+    
+    print(f"✅ Using {PPE_BACKEND} model {export_path}")
+    return YOLO(export_path, task="detect")
+
+
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
@@ -66,8 +162,17 @@ async def startup_event():
     # Load model
     if not os.path.exists(MODEL_PATH):
         raise FileNotFoundError(f"Model not found at {MODEL_PATH}")
-    model = YOLO(MODEL_PATH)
+    model = load_inference_model()
     print(f"✅ Model loaded successfully from {MODEL_PATH}")
+    
+    # Compile the PyTorch forward pass in place on CUDA hosts (exported backends are already optimized).
+    # Batches range from 1 to MAX_BATCH_IMAGES images, so compile for a dynamic batch dimension
+    # instead of recompiling (and capturing CUDA graphs) for every new batch size
+    if hasattr(torch, "compile") and torch.cuda.is_available() and isinstance(model.model, torch.nn.Module):
+        model.model.forward = torch.compile(model.model.forward, dynamic=True)
+    
+    # Warm up so the first request doesn't pay for predictor setup and kernel selection
+    _predict(np.zeros((640, 640, 3), dtype=np.uint8), 0.25)
 
 
 @app.get("/")
@@ -134,84 +239,201 @@ async def model_info():
     }
 
 
-def process_image(
-    image_bytes: bytes,
-    filename: str,
-    conf_threshold: float,
-    check_compliance_flag: bool = False
-) -> Dict:
-    """Helper function to process a single image"""
-    start_time = time.time()
+def _run_predict(source, conf_threshold: float, kwargs: Dict):
+    """
+    Run model.predict (on the inference thread)
     
-    # Read image
-    image = Image.open(io.BytesIO(image_bytes))
-    img_array = np.array(image)
+    Runs under inference_mode so pre/post-processing tensor ops outside the model's own
+    no-grad forward skip autograd bookkeeping too.
+    """
+    with torch.inference_mode():
+        return model.predict(source=source, conf=conf_threshold, **PREDICT_KW, **kwargs)
+
+
+def _predict(source, conf_threshold: float, **kwargs):
+    """Run model.predict on the inference thread and wait for the results (blocking; any thread)"""
+    return inference_executor.submit(_run_predict, source, conf_threshold, kwargs).result()
+
+
+async def _run_inference(source, conf_threshold: float, **kwargs):
+    """Run inference on the inference thread so the event loop keeps serving requests"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, _run_predict, source, conf_threshold, kwargs)
+
+
+# Leading magic bytes of the image formats cv2.imdecode understands
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG", "PNG"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+)
+
+
+def _sniff_format(image_bytes) -> str:
+    """Detect the image format from its leading bytes"""
+    head = bytes(image_bytes[:12])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return "Unknown"
+
+
+@contextmanager
+def _upload_view(file: UploadFile):
+    """
+    Zero-copy, read-only view of an upload's contents
+    
+    Starlette spools uploads into a SpooledTemporaryFile: small ones are viewed through the
+    in-memory buffer, larger ones rolled over to disk are memory-mapped.
+    """
+    spooled = file.file
+    spooled.seek(0)
+    in_memory = getattr(spooled, "_file", spooled)
+    if isinstance(in_memory, io.BytesIO):
+        view = in_memory.getbuffer()
+    else:
+        view = mmap.mmap(spooled.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield view
+    finally:
+        if isinstance(view, memoryview):
+            view.release()
+        else:
+            view.close()
+
+
+def _decode_upload(file: UploadFile) -> Tuple[np.ndarray, Dict]:
+    """Decode an upload in place, without reading it into an intermediate bytes object"""
+    with _upload_view(file) as view:
+        return _decode(view, file.filename)
+
+
+def _decode(image_bytes, filename: str) -> Tuple[np.ndarray, Dict]:
+    """Decode an uploaded image (any bytes-like buffer) into a BGR array plus its metadata"""
+    # cv2.imdecode yields a contiguous BGR array in one call, skipping Pillow's copies
+    img_array = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img_array is None:
+        raise ValueError("Could not decode image")
     
     # Image metadata
     image_metadata = {
         "filename": filename,
-        "width": image.width,
-        "height": image.height,
+        "width": img_array.shape[1],
+        "height": img_array.shape[0],
         "size_kb": round(len(image_bytes) / 1024, 2),
-        "format": image.format if hasattr(image, 'format') else "Unknown"
+        "format": _sniff_format(image_bytes)
     }
     
-    # Convert RGB to BGR
-    if len(img_array.shape) == 3 and img_array.shape[2] == 3:
-        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-    
-    # Run inference
-    results = model.predict(source=img_array, conf=conf_threshold, verbose=False)
-    
-    # Parse results
-    detections = []
-    class_counts = {"person": 0, "helmet": 0, "safety-vest": 0}
-    
-    for result in results:
-        if result.boxes is not None and len(result.boxes) > 0:
-            for box, conf, cls in zip(result.boxes.xyxy, result.boxes.conf, result.boxes.cls):
-                x1, y1, x2, y2 = map(float, box)
-                confidence = float(conf)
-                class_id = int(cls)
-                class_name = model.names[class_id]
-                
-                bbox = {
-                    "x1": round(x1, 2),
-                    "y1": round(y1, 2),
-                    "x2": round(x2, 2),
-                    "y2": round(y2, 2)
-                }
-                
-                area = (bbox["x2"] - bbox["x1"]) * (bbox["y2"] - bbox["y1"])
-                
-                detection = {
-                    "class_id": class_id,
-                    "class_name": class_name,
-                    "confidence": round(confidence, 3),
-                    "bounding_box": bbox,
-                    "area": round(area, 2)
-                }
-                detections.append(detection)
-                
-                if class_name in class_counts:
-                    class_counts[class_name] += 1
+    return img_array, image_metadata
+
+
+def _build_response(result, metadata: Dict, check_compliance_flag: bool) -> Dict:
+    """Parse one Ultralytics result into detections, class counts and optional compliance"""
+    dets = parse_boxes(result)
     
     # Check compliance if requested
     compliance_result = None
     if check_compliance_flag:
-        compliance_result = check_compliance(detections)
-    
-    processing_time_ms = (time.time() - start_time) * 1000
+        compliance_result = check_compliance(dets)
     
     return {
-        "metadata": image_metadata,
-        "detections": detections,
-        "summary": class_counts,
-        "compliance": compliance_result,
-        "processing_time_ms": processing_time_ms
+        "metadata": metadata,
+        "detections": to_detection_dicts(dets, model.names),
+        "summary": counts_from_cls(dets.cls, CLASS_NAMES),
+        "compliance": compliance_result
     }
 
 
+def process_image(
+    file: UploadFile,
+    conf_threshold: float,
+    check_compliance_flag: bool = False
+) -> Dict:
+    """Helper function to process a single image"""
+    start_time = time.time()
+    
+    img_array, image_metadata = _decode_upload(file)
+    
+    # Run inference
+    results = _predict(img_array, conf_threshold)
+    
+    response = _build_response(results[0], image_metadata, check_compliance_flag)
+    response["processing_time_ms"] = (time.time() - start_time) * 1000
+    return response
+
+
+def _sample_frames(container, sample_rate: int, max_frames: int):
+    """
+    Decode a video and yield (frame_number, BGR frame) for every sample_rate-th frame
+    
+    Skipped frames are still decoded (later frames reference them) but never converted to arrays.
+    """
+    stream = container.streams.video[0]
+    stream.thread_type = "AUTO"
+    
+    sampled = 0
+    for frame_number, frame in enumerate(container.decode(stream)):
+        if frame_number % sample_rate:
+            continue
+        
+        yield frame_number, frame.to_ndarray(format="bgr24")
+        sampled += 1
+        if sampled == max_frames:
+            return
+
+
+def _prefetch_batches(frames, batch_size: int):
+    """
+    Consume a frame generator on a background thread and yield batches of its items
+    
+    Frames are handed over through a bounded queue, so decoding the next batch overlaps with
+    inference on the current one while memory stays capped at FRAME_QUEUE_SIZE frames.
+    """
+    frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    stop = threading.Event()
+    
+    def produce():
+        try:
+            for item in frames:
+                frame_queue.put(item)
+                if stop.is_set():
+                    break
+        except Exception as e:
+            frame_queue.put(e)
+        frame_queue.put(None)
+    
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        batch = []
+        while True:
+            item = frame_queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        
+        if batch:
+            yield batch
+    finally:
+        # If the consumer stops early, unblock the producer and wait for it to finish
+        stop.set()
+        while producer.is_alive():
+            try:
+                frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(
     file: UploadFile = File(...),
@@ -230,10 +452,9 @@ async def predict(
     
     try:
         request_id = generate_request_id()
-        contents = await file.read()
         
-        # Process image
-        result = process_image(contents, file.filename, conf_threshold, check_compliance_flag)
+        # Decode and process the image off the event loop
+        result = await asyncio.to_thread(process_image, file, conf_threshold, check_compliance_flag)
         
         # Save to database
         save_detection_record(
@@ -256,22 +477,21 @@ async def predict(
             "metadata": result["metadata"],
             "detections_count": len(result["detections"]),
             "detections": [
-                Detection(
+                Detection.model_construct(
                     class_id=d["class_id"],
                     class_name=d["class_name"],
                     confidence=d["confidence"],
-                    bounding_box=BoundingBox(**d["bounding_box"]),
-                    area=d["area"]
+                    bounding_box=BoundingBox.model_construct(**d["bounding_box"])
                 ) for d in result["detections"]
             ],
-            "summary": DetectionSummary(**result["summary"]),
+            "summary": DetectionSummary.model_construct(**result["summary"]),
             "confidence_threshold": conf_threshold,
-            "metrics": ProcessingMetrics(
+            "metrics": ProcessingMetrics.model_construct(
                 processing_time_ms=result["processing_time_ms"],
                 timestamp=datetime.utcnow(),
                 request_id=request_id
             ),
-            "compliance": ComplianceStatus(**result["compliance"]) if result["compliance"] else None
+            "compliance": ComplianceStatus.model_construct(**result["compliance"]) if result["compliance"] else None
         }
         
         return response_data
@@ -282,6 +502,45 @@ async def predict(
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
 
+@lru_cache(maxsize=512)
+def _label_size(label: str):
+    """Cached cv2.getTextSize for box labels (class name + 2-decimal confidence)"""
+    return cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+
+
+def _draw_detections(img: np.ndarray, xyxy: np.ndarray, confs: np.ndarray, clss: np.ndarray):
+    """Draw bounding boxes and labels onto a BGR image in place"""
+    # Box outlines: one polylines call per class instead of one rectangle call per box
+    corners = xyxy[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+    for class_id in np.unique(clss).tolist():
+        cv2.polylines(img, list(corners[clss == class_id]), True, CLASS_COLORS[class_id], 2)
+    
+    # Labels are drawn on top of all outlines
+    names = model.names
+    for (x1, y1, _, _), confidence, class_id in zip(xyxy.tolist(), confs.tolist(), clss.tolist()):
+        color = CLASS_COLORS[class_id]
+        label = f"{names[class_id]}: {confidence:.2f}"
+        (label_width, label_height), baseline = _label_size(label)
+        
+        # Background rectangle for the label, then the text
+        cv2.rectangle(
+            img,
+            (x1, y1 - label_height - baseline - 5),
+            (x1 + label_width, y1),
+            color,
+            -1
+        )
+        cv2.putText(
+            img,
+            label,
+            (x1, y1 - baseline - 5),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.6,
+            (255, 255, 255),
+            2
+        )
+
+
 @app.post("/predict-image")
 async def predict_image(
     file: UploadFile = File(...),
@@ -297,64 +556,27 @@ async def predict_image(
         raise HTTPException(status_code=400, detail="File must be an image")
     
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        img_array = np.array(image)
-        
-        if len(img_array.shape) == 3 and img_array.shape[2] == 3:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        
-        results = model.predict(source=img_array, conf=conf_threshold, verbose=False)
-        annotated_img = img_array.copy()
-        
-        colors = {
-            "person": (0, 255, 0),
-            "helmet": (255, 0, 0),
-            "safety-vest": (0, 165, 255)
-        }
-        
-        for result in results:
-            if result.boxes is not None and len(result.boxes) > 0:
-                for box, conf, cls in zip(result.boxes.xyxy, result.boxes.conf, result.boxes.cls):
-                    x1, y1, x2, y2 = map(int, box)
-                    confidence = float(conf)
-                    class_id = int(cls)
-                    class_name = model.names[class_id]
-                    color = colors.get(class_name, (255, 255, 255))
-                    
-                    cv2.rectangle(annotated_img, (x1, y1), (x2, y2), color, 2)
-                    label = f"{class_name}: {confidence:.2f}"
-                    
-                    (label_width, label_height), baseline = cv2.getTextSize(
-                        label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2
-                    )
-                    
-                    cv2.rectangle(
-                        annotated_img,
-                        (x1, y1 - label_height - baseline - 5),
-                        (x1 + label_width, y1),
-                        color,
-                        -1
-                    )
-                    
-                    cv2.putText(
-                        annotated_img,
-                        label,
-                        (x1, y1 - baseline - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.6,
-                        (255, 255, 255),
-                        2
-                    )
-        
-        annotated_img = cv2.cvtColor(annotated_img, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(annotated_img)
+        img_array, _ = await asyncio.to_thread(_decode_upload, file)
+        
+        results = await _run_inference(img_array, conf_threshold)
+        annotated_img = img_array
+        
+        boxes = results[0].boxes
+        if boxes is not None and len(boxes) > 0:
+            _draw_detections(
+                annotated_img,
+                boxes.xyxy.cpu().numpy().astype(np.int32),
+                boxes.conf.cpu().numpy(),
+                boxes.cls.cpu().numpy().astype(np.int64)
+            )
         
-        img_buffer = io.BytesIO()
-        pil_img.save(img_buffer, format="JPEG", quality=95)
-        img_buffer.seek(0)
+        # Encode the BGR buffer directly with libjpeg-turbo
+        ok, encoded = cv2.imencode(".jpg", annotated_img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        if not ok:
+            raise ValueError("Could not encode annotated image")
         
-        return StreamingResponse(img_buffer, media_type="image/jpeg")
+        # Send the encoded bytes as one body; streaming a BytesIO iterates it line by line
+        return Response(content=encoded.tobytes(), media_type="image/jpeg")
         
     except Exception as e:
         import traceback
@@ -378,8 +600,8 @@ async def predict_batch(
     if len(files) == 0:
         raise HTTPException(status_code=400, detail="No files provided")
     
-    if len(files) > 50:
-        raise HTTPException(status_code=400, detail="Maximum 50 images allowed per batch")
+    if len(files) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_BATCH_IMAGES} images allowed per batch")
     
     request_id = generate_request_id()
     batch_start_time = time.time()
@@ -387,21 +609,48 @@ async def predict_batch(
     results = []
     failed_images = 0
     
-    for file in files:
+    # Decode all uploads in parallel on worker threads, straight from their spooled files,
+    # so inference runs as a single batched call
+    image_files = [
+        file for file in files
+        if not file.content_type or file.content_type.startswith("image/")
+    ]
+    failed_images += len(files) - len(image_files)
+    
+    decoded = await asyncio.gather(
+        *(asyncio.to_thread(_decode_upload, file) for file in image_files),
+        return_exceptions=True
+    )
+    
+    imgs = []
+    metas = []
+    for file, item in zip(image_files, decoded):
+        if isinstance(item, Exception):
+            print(f"Error processing {file.filename}: {str(item)}")
+            failed_images += 1
+            continue
+        img_array, image_metadata = item
+        imgs.append(img_array)
+        metas.append(image_metadata)
+    
+    if imgs:
+        predictions = await _run_inference(imgs, conf_threshold, batch=len(imgs))
+        # Decode and inference time is shared evenly across the batch
+        per_image_time_ms = (time.time() - batch_start_time) * 1000 / len(imgs)
+    else:
+        predictions = []
+    
+    record_rows = []
+    for i, (prediction, image_metadata) in enumerate(zip(predictions, metas)):
         try:
-            if file.content_type and not file.content_type.startswith("image/"):
-                failed_images += 1
-                continue
-            
-            contents = await file.read()
-            result = process_image(contents, file.filename, conf_threshold, check_compliance_flag)
+            result = _build_response(prediction, image_metadata, check_compliance_flag)
+            result["processing_time_ms"] = per_image_time_ms
             
-            # Save individual detection
-            img_request_id = generate_request_id()
-            save_detection_record(
-                db=db,
+            # Queue the record; all images are saved together after the loop
+            img_request_id = generate_child_id(request_id, i)
+            record_rows.append(detection_record_row(
                 request_id=img_request_id,
-                filename=file.filename,
+                filename=image_metadata["filename"],
                 image_metadata=result["metadata"],
                 detections=result["detections"],
                 summary=result["summary"],
@@ -409,7 +658,7 @@ async def predict_batch(
                 processing_time_ms=result["processing_time_ms"],
                 endpoint="predict-batch",
                 compliance=result["compliance"]
-            )
+            ))
             
             # Build individual response
             response_data = {
@@ -418,30 +667,36 @@ async def predict_batch(
                 "metadata": result["metadata"],
                 "detections_count": len(result["detections"]),
                 "detections": [
-                    Detection(
+                    Detection.model_construct(
                         class_id=d["class_id"],
                         class_name=d["class_name"],
                         confidence=d["confidence"],
-                        bounding_box=BoundingBox(**d["bounding_box"]),
-                        area=d["area"]
+                        bounding_box=BoundingBox.model_construct(**d["bounding_box"])
                     ) for d in result["detections"]
                 ],
-                "summary": DetectionSummary(**result["summary"]),
+                "summary": DetectionSummary.model_construct(**result["summary"]),
                 "confidence_threshold": conf_threshold,
-                "metrics": ProcessingMetrics(
+                "metrics": ProcessingMetrics.model_construct(
                     processing_time_ms=result["processing_time_ms"],
                     timestamp=datetime.utcnow(),
                     request_id=img_request_id
                 ),
-                "compliance": ComplianceStatus(**result["compliance"]) if result["compliance"] else None
+                "compliance": ComplianceStatus.model_construct(**result["compliance"]) if result["compliance"] else None
             }
             
             results.append(response_data)
             
         except Exception as e:
-            print(f"Error processing {file.filename}: {str(e)}")
+            print(f"Error processing {image_metadata['filename']}: {str(e)}")
             failed_images += 1
     
+    try:
+        save_detection_records_bulk(db, record_rows)
+    except Exception as e:
+        # The predictions are still valid; only the history rows are lost
+        db.rollback()
+        print(f"Error saving {len(record_rows)} detection records: {str(e)}")
+    
     total_processing_time_ms = (time.time() - batch_start_time) * 1000
     avg_time = total_processing_time_ms / len(results) if results else 0
     
@@ -471,9 +726,8 @@ async def check_compliance_endpoint(
     
     try:
         request_id = generate_request_id()
-        contents = await file.read()
         
-        result = process_image(contents, file.filename, conf_threshold, check_compliance_flag=True)
+        result = await asyncio.to_thread(process_image, file, conf_threshold, check_compliance_flag=True)
         
         # Save to database
         save_detection_record(
@@ -494,7 +748,7 @@ async def check_compliance_endpoint(
             "request_id": request_id,
             "filename": file.filename,
             "summary": result["summary"],
-            "compliance": ComplianceStatus(**result["compliance"]),
+            "compliance": ComplianceStatus.model_construct(**result["compliance"]),
             "processing_time_ms": result["processing_time_ms"]
         }
         
@@ -502,6 +756,104 @@ async def check_compliance_endpoint(
         raise HTTPException(status_code=500, detail=f"Error checking compliance: {str(e)}")
 
 
+def _process_video(
+    video_file: BinaryIO,
+    conf_threshold: float,
+    sample_rate: int,
+    max_frames: int
+) -> Tuple[Dict, Dict, List[Dict]]:
+    """Decode, run inference on and summarize a video file (blocking; run in a worker thread)"""
+    # Open video, reading straight from the upload's file object
+    container = av.open(video_file, mode="r", hwaccel=VIDEO_HWACCEL)
+    stream = container.streams.video[0]
+    fps = float(stream.average_rate or 0)
+    total_frames = stream.frames
+    if not total_frames and fps > 0:
+        # Containers such as WebM / MKV store no frame count; estimate it from the duration
+        if stream.duration is not None:
+            seconds = float(stream.duration * stream.time_base)
+        elif container.duration is not None:
+            seconds = container.duration / av.time_base
+        else:
+            seconds = 0
+        total_frames = round(seconds * fps)
+    duration = total_frames / fps if fps > 0 else 0
+    
+    frame_detections = []
+    processed_frames = 0
+    total_detections = 0
+    
+    # Person / helmet / vest counts summed over processed frames (max_frames is user-supplied,
+    # so nothing is sized by it)
+    count_totals = np.zeros(len(CLASS_NAMES), dtype=np.int64)
+    
+    compliant_frames = 0
+    non_compliant_frames = 0
+    
+    # Decode on a background thread while batches run through the model here; the batch
+    # generator is closed (joining its thread) before the container
+    frames = _sample_frames(container, sample_rate, max_frames)
+    with container, closing(_prefetch_batches(frames, VIDEO_BATCH_SIZE)) as batches:
+        for batch in batches:
+            # Run inference on the whole batch of sampled frames
+            frame_numbers = [frame_number for frame_number, _ in batch]
+            batch_frames = [frame for _, frame in batch]
+            results = _predict(batch_frames, conf_threshold, batch=len(batch_frames))
+            
+            for frame_number, result in zip(frame_numbers, results):
+                dets = parse_boxes(result)
+                frame_counts = np.bincount(dets.cls, minlength=len(CLASS_NAMES))[:len(CLASS_NAMES)]
+                count_totals += frame_counts
+                
+                # Check compliance
+                compliance = check_compliance(dets)
+                is_compliant = compliance["is_compliant"]
+                
+                if is_compliant:
+                    compliant_frames += 1
+                else:
+                    non_compliant_frames += 1
+                
+                # Only the first frames are returned, so later ones skip building detection dicts
+                if len(frame_detections) < MAX_RESPONSE_FRAMES:
+                    frame_detections.append({
+                        "frame_number": frame_number,
+                        "timestamp_seconds": round(frame_number / fps, 2) if fps > 0 else 0,
+                        "detections": to_detection_dicts(dets, model.names),
+                        "summary": dict(zip(CLASS_NAMES, frame_counts.tolist())),
+                        "is_compliant": is_compliant
+                    })
+                
+                total_detections += len(dets.cls)
+                
+                processed_frames += 1
+    
+    # Calculate averages
+    avg_person, avg_helmet, avg_vest = (
+        (count_totals / processed_frames).tolist() if processed_frames else (0, 0, 0)
+    )
+    compliance_rate = (compliant_frames / processed_frames * 100) if processed_frames > 0 else 0
+    
+    video_metadata = {
+        "total_frames": total_frames,
+        "fps": fps,
+        "duration_seconds": duration
+    }
+    
+    processing_results = {
+        "frames_processed": processed_frames,
+        "total_detections": total_detections,
+        "avg_person_count": avg_person,
+        "avg_helmet_count": avg_helmet,
+        "avg_vest_count": avg_vest,
+        "compliant_frames": compliant_frames,
+        "non_compliant_frames": non_compliant_frames,
+        "compliance_rate": compliance_rate
+    }
+    
+    return video_metadata, processing_results, frame_detections
+
+
 @app.post("/predict-video", response_model=VideoProcessingResponse)
 async def predict_video(
     file: UploadFile = File(...),
@@ -523,130 +875,15 @@ async def predict_video(
         request_id = generate_request_id()
         start_time = time.time()
         
-        # Save uploaded video temporarily
-        temp_video_path = f"/tmp/{request_id}_{file.filename}"
-        contents = await file.read()
-        with open(temp_video_path, "wb") as f:
-            f.write(contents)
-        
-        # Open video
-        cap = cv2.VideoCapture(temp_video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        duration = total_frames / fps if fps > 0 else 0
-        
-        frame_detections = []
-        frame_number = 0
-        processed_frames = 0
-        total_detections = 0
-        
-        person_counts = []
-        helmet_counts = []
-        vest_counts = []
-        
-        compliant_frames = 0
-        non_compliant_frames = 0
-        
-        while cap.isOpened() and processed_frames < max_frames:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Process every Nth frame
-            if frame_number % sample_rate == 0:
-                # Run inference
-                results = model.predict(source=frame, conf=conf_threshold, verbose=False)
-                
-                detections = []
-                class_counts = {"person": 0, "helmet": 0, "safety-vest": 0}
-                
-                for result in results:
-                    if result.boxes is not None and len(result.boxes) > 0:
-                        for box, conf, cls in zip(result.boxes.xyxy, result.boxes.conf, result.boxes.cls):
-                            x1, y1, x2, y2 = map(float, box)
-                            confidence = float(conf)
-                            class_id = int(cls)
-                            class_name = model.names[class_id]
-                            
-                            bbox = {
-                                "x1": round(x1, 2),
-                                "y1": round(y1, 2),
-                                "x2": round(x2, 2),
-                                "y2": round(y2, 2)
-                            }
-                            area = (bbox["x2"] - bbox["x1"]) * (bbox["y2"] - bbox["y1"])
-                            
-                            detection = {
-                                "class_id": class_id,
-                                "class_name": class_name,
-                                "confidence": round(confidence, 3),
-                                "bounding_box": bbox,
-                                "area": round(area, 2)
-                            }
-                            detections.append(detection)
-                            
-                            if class_name in class_counts:
-                                class_counts[class_name] += 1
-                
-                # Check compliance
-                compliance = check_compliance(detections)
-                is_compliant = compliance["is_compliant"]
-                
-                if is_compliant:
-                    compliant_frames += 1
-                else:
-                    non_compliant_frames += 1
-                
-                frame_detections.append({
-                    "frame_number": frame_number,
-                    "timestamp_seconds": round(frame_number / fps, 2) if fps > 0 else 0,
-                    "detections": detections,
-                    "summary": class_counts,
-                    "is_compliant": is_compliant
-                })
-                
-                total_detections += len(detections)
-                person_counts.append(class_counts["person"])
-                helmet_counts.append(class_counts["helmet"])
-                vest_counts.append(class_counts["safety-vest"])
-                
-                processed_frames += 1
-            
-            frame_number += 1
-        
-        cap.release()
-        
-        # Clean up temp file
-        if os.path.exists(temp_video_path):
-            os.remove(temp_video_path)
+        # Decode the upload in place (no temp file copy) and run inference off the event loop
+        video_metadata, processing_results, frame_detections = await asyncio.to_thread(
+            _process_video, file.file, conf_threshold, sample_rate, max_frames
+        )
         
         processing_time = time.time() - start_time
-        
-        # Calculate averages
-        avg_person = sum(person_counts) / len(person_counts) if person_counts else 0
-        avg_helmet = sum(helmet_counts) / len(helmet_counts) if helmet_counts else 0
-        avg_vest = sum(vest_counts) / len(vest_counts) if vest_counts else 0
-        compliance_rate = (compliant_frames / processed_frames * 100) if processed_frames > 0 else 0
+        processing_results["processing_time_seconds"] = processing_time
         
         # Save to database
-        video_metadata = {
-            "total_frames": total_frames,
-            "fps": fps,
-            "duration_seconds": duration
-        }
-        
-        processing_results = {
-            "frames_processed": processed_frames,
-            "total_detections": total_detections,
-            "avg_person_count": avg_person,
-            "avg_helmet_count": avg_helmet,
-            "avg_vest_count": avg_vest,
-            "compliant_frames": compliant_frames,
-            "non_compliant_frames": non_compliant_frames,
-            "compliance_rate": compliance_rate,
-            "processing_time_seconds": processing_time
-        }
-        
         save_video_processing_record(
             db=db,
             request_id=request_id,
@@ -662,39 +899,38 @@ async def predict_video(
             request_id=request_id,
             filename=file.filename,
             metadata={
-                "total_frames": total_frames,
-                "fps": fps,
-                "duration_seconds": round(duration, 2),
+                "total_frames": video_metadata["total_frames"],
+                "fps": video_metadata["fps"],
+                "duration_seconds": round(video_metadata["duration_seconds"], 2),
                 "sample_rate": sample_rate
             },
-            total_frames=total_frames,
-            processed_frames=processed_frames,
+            total_frames=video_metadata["total_frames"],
+            processed_frames=processing_results["frames_processed"],
             frame_detections=[
-                VideoFrameDetection(
+                VideoFrameDetection.model_construct(
                     frame_number=fd["frame_number"],
                     timestamp_seconds=fd["timestamp_seconds"],
                     detections=[
-                        Detection(
+                        Detection.model_construct(
                             class_id=d["class_id"],
                             class_name=d["class_name"],
                             confidence=d["confidence"],
-                            bounding_box=BoundingBox(**d["bounding_box"]),
-                            area=d["area"]
+                            bounding_box=BoundingBox.model_construct(**d["bounding_box"])
                         ) for d in fd["detections"]
                     ],
-                    summary=DetectionSummary(**fd["summary"]),
+                    summary=DetectionSummary.model_construct(**fd["summary"]),
                     is_compliant=fd["is_compliant"]
-                ) for fd in frame_detections[:50]  # Limit response size
+                ) for fd in frame_detections
             ],
             overall_summary={
-                "total_detections": total_detections,
-                "avg_person_count": round(avg_person, 2),
-                "avg_helmet_count": round(avg_helmet, 2),
-                "avg_vest_count": round(avg_vest, 2),
-                "compliant_frames": compliant_frames,
-                "non_compliant_frames": non_compliant_frames
+                "total_detections": processing_results["total_detections"],
+                "avg_person_count": round(processing_results["avg_person_count"], 2),
+                "avg_helmet_count": round(processing_results["avg_helmet_count"], 2),
+                "avg_vest_count": round(processing_results["avg_vest_count"], 2),
+                "compliant_frames": processing_results["compliant_frames"],
+                "non_compliant_frames": processing_results["non_compliant_frames"]
             },
-            compliance_rate=round(compliance_rate, 2),
+            compliance_rate=round(processing_results["compliance_rate"], 2),
             processing_time_seconds=round(processing_time, 2)
         )
         
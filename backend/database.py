@@ -1,99 +1,158 @@
 """Database configuration and models for PPE Detection API"""
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, Float, Index, JSON, LargeBinary
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker
 from datetime import datetime
+from typing import Any, Optional
+import json
 import os
+import zlib
 
 # Database URL (SQLite for simplicity, can be changed to PostgreSQL, MySQL, etc.)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ppe_detection.db")
 
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
+    # Rows per multi-row INSERT statement when saving detection records in bulk
+    insertmanyvalues_page_size=1000
 )
 
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """WAL journal with NORMAL sync: readers don't block on writes and commits skip most fsyncs"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-64000")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+
+
+class Base(DeclarativeBase):
+    # Keep FLOAT columns for float attributes (SQLAlchemy 2.1 would default to DOUBLE)
+    type_annotation_map = {float: Float}
+
+
+class CompressedJSON(TypeDecorator):
+    """
+    JSON column stored zlib-compressed on SQLite (plain JSON on other databases)
+    
+    Rows written before compression was enabled hold JSON text and are still read back.
+    """
+    impl = LargeBinary
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(LargeBinary())
+        return dialect.type_descriptor(JSON())
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "sqlite":
+            return value
+        return zlib.compress(json.dumps(value, separators=(",", ":")).encode(), 1)
+    
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name != "sqlite":
+            return value
+        if isinstance(value, bytes):
+            return json.loads(zlib.decompress(value))
+        return json.loads(value)
 
 
 class DetectionRecord(Base):
     """Model for storing detection records"""
     __tablename__ = "detection_records"
     
-    id = Column(Integer, primary_key=True, index=True)
-    request_id = Column(String, unique=True, index=True)
-    filename = Column(String, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    request_id: Mapped[Optional[str]] = mapped_column(unique=True, index=True)
+    filename: Mapped[str]
+    timestamp: Mapped[Optional[datetime]] = mapped_column(default=datetime.utcnow, index=True)
     
     # Image metadata
-    image_width = Column(Integer)
-    image_height = Column(Integer)
-    image_size_kb = Column(Float)
+    image_width: Mapped[Optional[int]]
+    image_height: Mapped[Optional[int]]
+    image_size_kb: Mapped[Optional[float]]
     
     # Detection results
-    total_detections = Column(Integer, default=0)
-    person_count = Column(Integer, default=0)
-    helmet_count = Column(Integer, default=0)
-    vest_count = Column(Integer, default=0)
+    total_detections: Mapped[Optional[int]] = mapped_column(default=0)
+    person_count: Mapped[Optional[int]] = mapped_column(default=0)
+    helmet_count: Mapped[Optional[int]] = mapped_column(default=0)
+    vest_count: Mapped[Optional[int]] = mapped_column(default=0)
     
     # Configuration
-    confidence_threshold = Column(Float, default=0.25)
+    confidence_threshold: Mapped[Optional[float]] = mapped_column(default=0.25)
     
     # Performance metrics
-    processing_time_ms = Column(Float)
+    processing_time_ms: Mapped[Optional[float]]
     
     # Compliance status
-    is_compliant = Column(Boolean, nullable=True)
-    compliance_message = Column(String, nullable=True)
+    is_compliant: Mapped[Optional[bool]]
+    compliance_message: Mapped[Optional[str]]
     
-    # Detailed detections (stored as JSON)
-    detections_json = Column(JSON)
+    # Detailed detections (stored as JSON, compressed on SQLite)
+    detections_json: Mapped[Optional[Any]] = mapped_column(CompressedJSON)
     
     # Request metadata
-    endpoint = Column(String)  # predict, predict-batch, predict-video, etc.
+    endpoint: Mapped[Optional[str]]  # predict, predict-batch, predict-video, etc.
+    
+    # Analytics filter by time range and endpoint, and group violations by message
+    __table_args__ = (
+        Index("ix_det_ts_endpoint", "timestamp", "endpoint"),
+        Index("ix_det_compliance", "is_compliant", "compliance_message"),
+    )
 
 
 class VideoProcessingRecord(Base):
     """Model for storing video processing records"""
     __tablename__ = "video_processing_records"
     
-    id = Column(Integer, primary_key=True, index=True)
-    request_id = Column(String, unique=True, index=True)
-    filename = Column(String, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    request_id: Mapped[Optional[str]] = mapped_column(unique=True, index=True)
+    filename: Mapped[str]
+    timestamp: Mapped[Optional[datetime]] = mapped_column(default=datetime.utcnow, index=True)
     
     # Video metadata
-    total_frames = Column(Integer)
-    fps = Column(Float)
-    duration_seconds = Column(Float)
+    total_frames: Mapped[Optional[int]]
+    fps: Mapped[Optional[float]]
+    duration_seconds: Mapped[Optional[float]]
     
     # Processing results
-    frames_processed = Column(Integer)
-    total_detections = Column(Integer, default=0)
+    frames_processed: Mapped[Optional[int]]
+    total_detections: Mapped[Optional[int]] = mapped_column(default=0)
     
     # Average counts per frame
-    avg_person_count = Column(Float, default=0.0)
-    avg_helmet_count = Column(Float, default=0.0)
-    avg_vest_count = Column(Float, default=0.0)
+    avg_person_count: Mapped[Optional[float]] = mapped_column(default=0.0)
+    avg_helmet_count: Mapped[Optional[float]] = mapped_column(default=0.0)
+    avg_vest_count: Mapped[Optional[float]] = mapped_column(default=0.0)
     
     # Compliance
-    compliant_frames = Column(Integer, default=0)
-    non_compliant_frames = Column(Integer, default=0)
-    compliance_rate = Column(Float, default=0.0)
+    compliant_frames: Mapped[Optional[int]] = mapped_column(default=0)
+    non_compliant_frames: Mapped[Optional[int]] = mapped_column(default=0)
+    compliance_rate: Mapped[Optional[float]] = mapped_column(default=0.0)
     
     # Performance
-    processing_time_seconds = Column(Float)
+    processing_time_seconds: Mapped[Optional[float]]
     
     # Configuration
-    confidence_threshold = Column(Float, default=0.25)
-    sample_rate = Column(Integer, default=1)  # Process every Nth frame
+    confidence_threshold: Mapped[Optional[float]] = mapped_column(default=0.25)
+    sample_rate: Mapped[Optional[int]] = mapped_column(default=1)  # Process every Nth frame
 
 
 def init_db():
     """Initialize the database"""
     Base.metadata.create_all(bind=engine)
+    
+    # create_all skips tables that already exist, so add indexes introduced since they were created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 
 def get_db():
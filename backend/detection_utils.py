@@ -0,0 +1,73 @@
+"""Helpers for turning YOLO results into detection arrays, counts and response dicts"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Sequence
+import numpy as np
+
+
+@dataclass
+class ParsedDets:
+    """Detections for one image as parallel arrays instead of per-box dicts"""
+    xyxy: np.ndarray  # (N, 4) boxes, rounded to 2 decimals
+    conf: np.ndarray  # (N,) confidences, rounded to 3 decimals
+    cls: np.ndarray   # (N,) class ids
+    area: np.ndarray  # (N,) box areas, rounded to 2 decimals
+
+
+def parse_boxes(result) -> ParsedDets:
+    """Convert one Ultralytics result into parallel box/confidence/class/area arrays"""
+    if result.boxes is None or len(result.boxes) == 0:
+        return ParsedDets(
+            xyxy=np.empty((0, 4)), conf=np.empty(0), cls=np.empty(0, dtype=np.int64), area=np.empty(0)
+        )
+
+    # One device-to-host copy of the (N, 6) x1, y1, x2, y2, conf, cls tensor, then round in bulk
+    data = result.boxes.data.cpu().numpy().astype(np.float64)
+    xyxy = np.round(data[:, :4], 2)
+    return ParsedDets(
+        xyxy=xyxy,
+        conf=np.round(data[:, 4], 3),
+        cls=data[:, 5].astype(np.int64),
+        area=np.round((xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1]), 2)
+    )
+
+
+def counts_from_cls(cls: np.ndarray, name_order: Sequence[str]) -> Dict[str, int]:
+    """Count detections per class, keyed by class name in name_order"""
+    return dict(zip(name_order, np.bincount(cls, minlength=len(name_order)).tolist()))
+
+
+def to_detection_dicts(dets: ParsedDets, names: Mapping[int, str]) -> List[Dict]:
+    """Materialize detection dicts for serialization and storage"""
+    return [
+        {
+            "class_id": class_id,
+            "class_name": names[class_id],
+            "confidence": confidence,
+            "bounding_box": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+            "area": area
+        }
+        for (x1, y1, x2, y2), confidence, class_id, area
+        in zip(dets.xyxy.tolist(), dets.conf.tolist(), dets.cls.tolist(), dets.area.tolist())
+    ]
+
+
+def from_detection_dicts(detections: List[Dict]) -> ParsedDets:
+    """Build parallel arrays back from detection dicts (inverse of to_detection_dicts)"""
+    if not detections:
+        return ParsedDets(
+            xyxy=np.empty((0, 4)), conf=np.empty(0), cls=np.empty(0, dtype=np.int64), area=np.empty(0)
+        )
+
+    # One pass over the dicts into an (N, 7) x1, y1, x2, y2, conf, cls, area array
+    data = np.array([
+        (box["x1"], box["y1"], box["x2"], box["y2"], d["confidence"], d["class_id"], d.get("area", 0.0))
+        for d in detections
+        for box in (d["bounding_box"],)
+    ], dtype=np.float64)
+    return ParsedDets(
+        xyxy=data[:, :4],
+        conf=data[:, 4],
+        cls=data[:, 5].astype(np.int64),
+        area=data[:, 6]
+    )
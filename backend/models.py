@@ -1,9 +1,10 @@
 """Pydantic models for request/response validation"""
 
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, computed_field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
+from functools import cached_property
 
 
 class DetectionClass(str, Enum):
@@ -20,19 +21,22 @@ class BoundingBox(BaseModel):
     x2: float = Field(..., description="Bottom-right x coordinate")
     y2: float = Field(..., description="Bottom-right y coordinate")
     
-    @property
+    # Boxes are immutable, so derived values are computed once per instance
+    model_config = ConfigDict(frozen=True)
+    
+    @cached_property
     def width(self) -> float:
         return self.x2 - self.x1
     
-    @property
+    @cached_property
     def height(self) -> float:
         return self.y2 - self.y1
     
-    @property
+    @cached_property
     def area(self) -> float:
         return self.width * self.height
     
-    @property
+    @cached_property
     def center(self) -> tuple:
         return ((self.x1 + self.x2) / 2, (self.y1 + self.y2) / 2)
 
@@ -43,9 +47,13 @@ class Detection(BaseModel):
     class_name: str = Field(..., description="Class name")
     confidence: float = Field(..., ge=0.0, le=1.0, description="Detection confidence score")
     bounding_box: BoundingBox = Field(..., description="Bounding box coordinates")
-    area: float = Field(..., description="Bounding box area in pixels")
     
-    model_config = ConfigDict(json_schema_extra={
+    @computed_field(description="Bounding box area in pixels")
+    @property
+    def area(self) -> float:
+        return round(self.bounding_box.area, 2)
+    
+    model_config = ConfigDict(frozen=True, json_schema_extra={
         "example": {
             "class_id": 0,
             "class_name": "person",
@@ -1,16 +1,94 @@
 """Utility functions for database operations and analytics"""
 
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, and_
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy import func, desc, and_, case, insert
 from database import DetectionRecord, VideoProcessingRecord
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
-import uuid
+from typing import Optional, Dict, Any, List, Union
+from detection_utils import ParsedDets, from_detection_dicts
+import numpy as np
+import copy
+import threading
+import time
+import secrets
+
+# Class ids of the PPE model
+PERSON_CLASS_ID = 0
+HELMET_CLASS_ID = 1
+VEST_CLASS_ID = 2
+
+# get_analytics results are cached per (days, endpoint) until the next detection record write,
+# or for at most ANALYTICS_CACHE_TTL seconds (writes from other worker processes are not seen)
+ANALYTICS_CACHE_TTL = 30
+ANALYTICS_CACHE_SIZE = 32
+_analytics_cache: Dict[tuple, tuple] = {}
+_analytics_version = 0
+_analytics_lock = threading.Lock()
+
+# Insert statements are built once and reused, so SQLAlchemy's compiled-SQL cache
+# is hit without rebuilding the statement and its cache key on every save
+INSERT_DETECTION_RECORD = insert(DetectionRecord)
+INSERT_VIDEO_PROCESSING_RECORD = insert(VideoProcessingRecord)
 
 
 def generate_request_id() -> str:
     """Generate a unique request ID"""
-    return f"req_{uuid.uuid4().hex[:12]}"
+    return f"req_{secrets.token_hex(6)}"
+
+
+def generate_child_id(parent_id: str, index: int) -> str:
+    """Derive the ID of one item (image, frame) of a multi-item request from the request's ID"""
+    return f"{parent_id}_{index}"
+
+
+def detection_record_row(
+    request_id: str,
+    filename: str,
+    image_metadata: Dict[str, Any],
+    detections: List[Dict[str, Any]],
+    summary: Dict[str, int],
+    confidence_threshold: float,
+    processing_time_ms: float,
+    endpoint: str = "predict",
+    compliance: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Build the column values of a detection record"""
+    return {
+        "request_id": request_id,
+        "filename": filename,
+        "timestamp": datetime.utcnow(),
+        "image_width": image_metadata.get("width"),
+        "image_height": image_metadata.get("height"),
+        "image_size_kb": image_metadata.get("size_kb"),
+        "total_detections": len(detections),
+        "person_count": summary.get("person", 0),
+        "helmet_count": summary.get("helmet", 0),
+        "vest_count": summary.get("safety-vest", 0),
+        "confidence_threshold": confidence_threshold,
+        "processing_time_ms": processing_time_ms,
+        "detections_json": detections,
+        "endpoint": endpoint,
+        "is_compliant": compliance.get("is_compliant") if compliance else None,
+        "compliance_message": compliance.get("message") if compliance else None
+    }
+
+
+def save_detection_records_bulk(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Save many detection records with one multi-row INSERT and a single commit"""
+    if not rows:
+        return
+    
+    db.execute(INSERT_DETECTION_RECORD, rows)
+    db.commit()
+    _invalidate_analytics()
+
+
+def _invalidate_analytics():
+    """Drop cached analytics after detection records are written"""
+    global _analytics_version
+    with _analytics_lock:
+        _analytics_version += 1
+        _analytics_cache.clear()
 
 
 def save_detection_record(
@@ -24,32 +102,12 @@ def save_detection_record(
     processing_time_ms: float,
     endpoint: str = "predict",
     compliance: Optional[Dict[str, Any]] = None
-) -> DetectionRecord:
+) -> None:
     """Save detection record to database"""
-    
-    record = DetectionRecord(
-        request_id=request_id,
-        filename=filename,
-        timestamp=datetime.utcnow(),
-        image_width=image_metadata.get("width"),
-        image_height=image_metadata.get("height"),
-        image_size_kb=image_metadata.get("size_kb"),
-        total_detections=len(detections),
-        person_count=summary.get("person", 0),
-        helmet_count=summary.get("helmet", 0),
-        vest_count=summary.get("safety-vest", 0),
-        confidence_threshold=confidence_threshold,
-        processing_time_ms=processing_time_ms,
-        detections_json=detections,
-        endpoint=endpoint,
-        is_compliant=compliance.get("is_compliant") if compliance else None,
-        compliance_message=compliance.get("message") if compliance else None
-    )
-    
-    db.add(record)
-    db.commit()
-    db.refresh(record)
-    return record
+    save_detection_records_bulk(db, [detection_record_row(
+        request_id, filename, image_metadata, detections, summary,
+        confidence_threshold, processing_time_ms, endpoint, compliance
+    )])
 
 
 def save_video_processing_record(
@@ -60,33 +118,29 @@ def save_video_processing_record(
     processing_results: Dict[str, Any],
     confidence_threshold: float,
     sample_rate: int = 1
-) -> VideoProcessingRecord:
+) -> None:
     """Save video processing record to database"""
     
-    record = VideoProcessingRecord(
-        request_id=request_id,
-        filename=filename,
-        timestamp=datetime.utcnow(),
-        total_frames=video_metadata.get("total_frames"),
-        fps=video_metadata.get("fps"),
-        duration_seconds=video_metadata.get("duration_seconds"),
-        frames_processed=processing_results.get("frames_processed"),
-        total_detections=processing_results.get("total_detections", 0),
-        avg_person_count=processing_results.get("avg_person_count", 0.0),
-        avg_helmet_count=processing_results.get("avg_helmet_count", 0.0),
-        avg_vest_count=processing_results.get("avg_vest_count", 0.0),
-        compliant_frames=processing_results.get("compliant_frames", 0),
-        non_compliant_frames=processing_results.get("non_compliant_frames", 0),
-        compliance_rate=processing_results.get("compliance_rate", 0.0),
-        processing_time_seconds=processing_results.get("processing_time_seconds"),
-        confidence_threshold=confidence_threshold,
-        sample_rate=sample_rate
-    )
-    
-    db.add(record)
+    db.execute(INSERT_VIDEO_PROCESSING_RECORD, {
+        "request_id": request_id,
+        "filename": filename,
+        "timestamp": datetime.utcnow(),
+        "total_frames": video_metadata.get("total_frames"),
+        "fps": video_metadata.get("fps"),
+        "duration_seconds": video_metadata.get("duration_seconds"),
+        "frames_processed": processing_results.get("frames_processed"),
+        "total_detections": processing_results.get("total_detections", 0),
+        "avg_person_count": processing_results.get("avg_person_count", 0.0),
+        "avg_helmet_count": processing_results.get("avg_helmet_count", 0.0),
+        "avg_vest_count": processing_results.get("avg_vest_count", 0.0),
+        "compliant_frames": processing_results.get("compliant_frames", 0),
+        "non_compliant_frames": processing_results.get("non_compliant_frames", 0),
+        "compliance_rate": processing_results.get("compliance_rate", 0.0),
+        "processing_time_seconds": processing_results.get("processing_time_seconds"),
+        "confidence_threshold": confidence_threshold,
+        "sample_rate": sample_rate
+    })
     db.commit()
-    db.refresh(record)
-    return record
 
 
 def get_analytics(
@@ -94,18 +148,51 @@ def get_analytics(
     days: int = 7,
     endpoint: Optional[str] = None
 ) -> Dict[str, Any]:
-    """Get analytics data for the specified time period"""
+    """Get analytics data for the specified time period (cached until the next write)"""
+    with _analytics_lock:
+        key = (days, endpoint, _analytics_version)
+        cached = _analytics_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return copy.deepcopy(cached[1])
+    
+    analytics = _compute_analytics(db, days, endpoint)
+    
+    with _analytics_lock:
+        # Only cache if no record was written while the queries ran
+        if key[2] == _analytics_version:
+            if len(_analytics_cache) >= ANALYTICS_CACHE_SIZE:
+                _analytics_cache.clear()
+            _analytics_cache[key] = (time.monotonic() + ANALYTICS_CACHE_TTL, analytics)
+    return copy.deepcopy(analytics)
+
+
+def _compute_analytics(db: Session, days: int, endpoint: Optional[str]) -> Dict[str, Any]:
+    """Run the analytics queries for the specified time period"""
     
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    # Base query
-    query = db.query(DetectionRecord).filter(DetectionRecord.timestamp >= start_date)
+    filters = [DetectionRecord.timestamp >= start_date]
     if endpoint:
-        query = query.filter(DetectionRecord.endpoint == endpoint)
+        filters.append(DetectionRecord.endpoint == endpoint)
+    
+    # Totals, compliance counts and timings in one aggregate query
+    totals = db.query(
+        func.count(DetectionRecord.id),
+        func.sum(DetectionRecord.total_detections),
+        func.sum(DetectionRecord.person_count),
+        func.sum(DetectionRecord.helmet_count),
+        func.sum(DetectionRecord.vest_count),
+        func.count(DetectionRecord.is_compliant),
+        func.sum(case((DetectionRecord.is_compliant.is_(True), 1), else_=0)),
+        func.avg(DetectionRecord.processing_time_ms),
+        func.min(DetectionRecord.processing_time_ms),
+        func.max(DetectionRecord.processing_time_ms)
+    ).filter(*filters).one()
     
-    records = query.all()
+    (total_requests, total_detections, total_persons, total_helmets, total_vests,
+     total_checks, compliant_count, avg_processing_time, min_processing_time, max_processing_time) = totals
     
-    if not records:
+    if not total_requests:
         return {
             "total_requests": 0,
             "date_range": {
@@ -120,55 +207,43 @@ def get_analytics(
             "performance_metrics": {}
         }
     
-    # Calculate statistics
-    total_requests = len(records)
-    total_detections = sum(r.total_detections for r in records)
-    total_persons = sum(r.person_count for r in records)
-    total_helmets = sum(r.helmet_count for r in records)
-    total_vests = sum(r.vest_count for r in records)
-    
     # Compliance statistics
-    compliance_records = [r for r in records if r.is_compliant is not None]
-    compliant_count = sum(1 for r in compliance_records if r.is_compliant)
-    compliance_rate = (compliant_count / len(compliance_records) * 100) if compliance_records else 0
-    
-    # Performance metrics
-    avg_processing_time = sum(r.processing_time_ms for r in records) / total_requests
-    min_processing_time = min(r.processing_time_ms for r in records)
-    max_processing_time = max(r.processing_time_ms for r in records)
-    
-    # Violations
-    violations = {}
-    for record in records:
-        if not record.is_compliant and record.compliance_message:
-            msg = record.compliance_message
-            violations[msg] = violations.get(msg, 0) + 1
-    
-    top_violations = [
-        {"violation": k, "count": v}
-        for k, v in sorted(violations.items(), key=lambda x: x[1], reverse=True)[:5]
-    ]
+    compliance_rate = (compliant_count / total_checks * 100) if total_checks else 0
+    
+    # Violations (most frequent first, ties by earliest occurrence)
+    violation_count = func.count(DetectionRecord.id)
+    violations = db.query(DetectionRecord.compliance_message, violation_count).filter(
+        *filters,
+        DetectionRecord.is_compliant.is_not(True),
+        DetectionRecord.compliance_message != ""
+    ).group_by(DetectionRecord.compliance_message).order_by(
+        violation_count.desc(), func.min(DetectionRecord.timestamp)
+    ).limit(5).all()
+    
+    top_violations = [{"violation": msg, "count": count} for msg, count in violations]
     
     # Daily trends
-    daily_stats = {}
-    for record in records:
-        date_key = record.timestamp.date().isoformat()
-        if date_key not in daily_stats:
-            daily_stats[date_key] = {
-                "date": date_key,
-                "requests": 0,
-                "detections": 0,
-                "persons": 0,
-                "helmets": 0,
-                "vests": 0
-            }
-        daily_stats[date_key]["requests"] += 1
-        daily_stats[date_key]["detections"] += record.total_detections
-        daily_stats[date_key]["persons"] += record.person_count
-        daily_stats[date_key]["helmets"] += record.helmet_count
-        daily_stats[date_key]["vests"] += record.vest_count
-    
-    detection_trends = sorted(daily_stats.values(), key=lambda x: x["date"])
+    day = func.date(DetectionRecord.timestamp)
+    daily_stats = db.query(
+        day,
+        func.count(DetectionRecord.id),
+        func.sum(DetectionRecord.total_detections),
+        func.sum(DetectionRecord.person_count),
+        func.sum(DetectionRecord.helmet_count),
+        func.sum(DetectionRecord.vest_count)
+    ).filter(*filters).group_by(day).order_by(day).all()
+    
+    detection_trends = [
+        {
+            "date": str(date_key),
+            "requests": requests,
+            "detections": detections,
+            "persons": persons,
+            "helmets": helmets,
+            "vests": vests
+        }
+        for date_key, requests, detections, persons, helmets, vests in daily_stats
+    ]
     
     return {
         "total_requests": total_requests,
@@ -185,9 +260,9 @@ def get_analytics(
             "avg_detections_per_request": round(total_detections / total_requests, 2)
         },
         "compliance_statistics": {
-            "total_checks": len(compliance_records),
+            "total_checks": total_checks,
             "compliant": compliant_count,
-            "non_compliant": len(compliance_records) - compliant_count,
+            "non_compliant": total_checks - compliant_count,
             "compliance_rate_percent": round(compliance_rate, 2)
         },
         "top_violations": top_violations,
@@ -205,8 +280,19 @@ def get_recent_detections(
     limit: int = 10,
     endpoint: Optional[str] = None
 ) -> List[DetectionRecord]:
-    """Get recent detection records"""
-    query = db.query(DetectionRecord).order_by(desc(DetectionRecord.timestamp))
+    """Get recent detection records (without the detections_json blob)"""
+    query = db.query(DetectionRecord).options(load_only(
+        DetectionRecord.request_id,
+        DetectionRecord.filename,
+        DetectionRecord.timestamp,
+        DetectionRecord.endpoint,
+        DetectionRecord.total_detections,
+        DetectionRecord.person_count,
+        DetectionRecord.helmet_count,
+        DetectionRecord.vest_count,
+        DetectionRecord.is_compliant,
+        DetectionRecord.processing_time_ms
+    )).order_by(desc(DetectionRecord.timestamp))
     
     if endpoint:
         query = query.filter(DetectionRecord.endpoint == endpoint)
@@ -214,20 +300,56 @@ def get_recent_detections(
     return query.limit(limit).all()
 
 
-def check_compliance(detections: List[Dict[str, Any]]) -> Dict[str, Any]:
+def boxes_overlap_or_close(persons: np.ndarray, gear: np.ndarray, threshold: float = 50) -> np.ndarray:
+    """
+    For each (x1, y1, x2, y2) person box, check if any gear box overlaps it or is close to it
+    
+    Compares all (P, G) pairs with broadcasting and returns a (P,) boolean array.
+    """
+    # Frames often have no helmets or no vests at all, then no person can have one
+    if len(gear) == 0:
+        return np.zeros(len(persons), dtype=bool)
+    
+    p = persons[:, None, :]
+    g = gear[None, :, :]
+    
+    # Check if boxes overlap
+    overlap = ~((p[..., 2] < g[..., 0]) | (p[..., 0] > g[..., 2]) |
+                (p[..., 3] < g[..., 1]) | (p[..., 1] > g[..., 3]))
+    has_gear = overlap.any(axis=1)
+    if has_gear.all():
+        return has_gear
+    
+    # For persons without an overlapping box, check if box centers are close (within
+    # threshold pixels), comparing squared distances against the squared threshold
+    unmatched = ~has_gear
+    person_centers = (persons[unmatched, :2] + persons[unmatched, 2:]) / 2
+    gear_centers = (gear[:, :2] + gear[:, 2:]) / 2
+    center_offset = person_centers[:, None, :] - gear_centers[None, :, :]
+    distance_sq = (center_offset ** 2).sum(axis=-1)
+    
+    has_gear[unmatched] = (distance_sq < threshold ** 2).any(axis=1)
+    return has_gear
+
+
+def check_compliance(dets: Union[ParsedDets, List[Dict[str, Any]]]) -> Dict[str, Any]:
     """
     Check if detected persons are wearing required PPE
     
     Logic:
     - For each person detected, check if there's a helmet and safety vest nearby
     - Consider PPE belongs to a person if bounding boxes overlap or are close
+    
+    Accepts parsed detection arrays, or a list of detection dicts (as stored in detections_json).
     """
+    if not isinstance(dets, ParsedDets):
+        dets = from_detection_dicts(dets)
     
-    persons = [d for d in detections if d["class_name"] == "person"]
-    helmets = [d for d in detections if d["class_name"] == "helmet"]
-    vests = [d for d in detections if d["class_name"] == "safety-vest"]
+    persons = dets.xyxy[dets.cls == PERSON_CLASS_ID]
+    helmets = dets.xyxy[dets.cls == HELMET_CLASS_ID]
+    vests = dets.xyxy[dets.cls == VEST_CLASS_ID]
     
-    if not persons:
+    if len(persons) == 0:
         return {
             "is_compliant": True,
             "message": "No persons detected",
@@ -243,45 +365,20 @@ def check_compliance(detections: List[Dict[str, Any]]) -> Dict[str, Any]:
     
     violations = []
     warnings = []
-    persons_with_helmet = 0
-    persons_with_vest = 0
-    fully_compliant = 0
-    
-    def boxes_overlap_or_close(box1, box2, threshold=50):
-        """Check if two bounding boxes overlap or are close to each other"""
-        b1 = box1["bounding_box"]
-        b2 = box2["bounding_box"]
-        
-        # Check if boxes overlap
-        if not (b1["x2"] < b2["x1"] or b1["x1"] > b2["x2"] or
-                b1["y2"] < b2["y1"] or b1["y1"] > b2["y2"]):
-            return True
-        
-        # Check if boxes are close (within threshold pixels)
-        center1_x = (b1["x1"] + b1["x2"]) / 2
-        center1_y = (b1["y1"] + b1["y2"]) / 2
-        center2_x = (b2["x1"] + b2["x2"]) / 2
-        center2_y = (b2["y1"] + b2["y2"]) / 2
-        
-        distance = ((center1_x - center2_x) ** 2 + (center1_y - center2_y) ** 2) ** 0.5
-        return distance < threshold
-    
-    for i, person in enumerate(persons, 1):
-        has_helmet = any(boxes_overlap_or_close(person, helmet) for helmet in helmets)
-        has_vest = any(boxes_overlap_or_close(person, vest) for vest in vests)
-        
-        if has_helmet:
-            persons_with_helmet += 1
-        else:
+    
+    # Test every person against every helmet / vest at once
+    has_helmet = boxes_overlap_or_close(persons, helmets)
+    has_vest = boxes_overlap_or_close(persons, vests)
+    
+    persons_with_helmet = int(has_helmet.sum())
+    persons_with_vest = int(has_vest.sum())
+    fully_compliant = int((has_helmet & has_vest).sum())
+    
+    for i, (person_has_helmet, person_has_vest) in enumerate(zip(has_helmet.tolist(), has_vest.tolist()), 1):
+        if not person_has_helmet:
             violations.append(f"Person #{i} is not wearing a helmet")
-        
-        if has_vest:
-            persons_with_vest += 1
-        else:
+        if not person_has_vest:
             violations.append(f"Person #{i} is not wearing a safety vest")
-        
-        if has_helmet and has_vest:
-            fully_compliant += 1
     
     # Overall compliance check
     is_compliant = len(violations) == 0